@@ -1,86 +1,152 @@
 import os
+import atexit
 import subprocess
-from openai import OpenAI
+import shlex
+import shutil
+import stat
+from openai import AsyncOpenAI
+import httpx
 import sys
 import datetime
 import logging
-import json
+import logging.handlers
+import queue
+import functools
+import hashlib
+import heapq
+import itertools
 import psutil
 import platform
 import requests
-import pyautogui
-import io
-import base64
-from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pathlib
-import webbrowser
-import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import threading
+import concurrent.futures
+import asyncio
+from cachetools import TTLCache
 # Import knowledge base and web processor
-from knowledge_base import KnowledgeBase
+from knowledge_base import KnowledgeBase, SemanticCache, _dumps, _loads
 from web_processor import WebProcessor
 
-def run_cmd(command):
+# Characters that need a real shell (pipes, redirection, expansion, chaining, comments)
+_SHELL_METACHARS = frozenset("|&;<>()$`*?~%^#[]{}!\n")
+
+def _command_argv(command):
+    """Return command in a form that can be executed without a shell, or None."""
+    if any(c in _SHELL_METACHARS for c in command):
+        return None
+    if os.name == "nt":
+        # CreateProcess parses the command line itself, quoting included
+        return command
     try:
-        result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-        return result.stdout + result.stderr
-    except subprocess.CalledProcessError as e:
-        return f"Error: {e.stderr}"
+        return shlex.split(command) or None
+    except ValueError:
+        return None
+
+def run_cmd(command, max_bytes=1_048_576):
+    """Run a command, streaming its combined output up to max_bytes bytes.
+
+    Plain commands are executed directly; anything using shell syntax, or a
+    shell builtin with no executable behind it, goes through the shell.
+    """
+    popen_kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=65536)
+    argv = _command_argv(command)
+    try:
+        process = None
+        if argv is not None:
+            try:
+                process = subprocess.Popen(argv, **popen_kwargs)
+            except FileNotFoundError:
+                pass
+        if process is None:
+            process = subprocess.Popen(command, shell=True, **popen_kwargs)
+    except OSError as e:
+        return f"Error: {str(e)}"
+
+    # Collect raw bytes in pipe-sized chunks and decode once at the end
+    buf = bytearray()
+    truncated = False
+    with process:
+        for chunk in iter(lambda: process.stdout.read(65536), b''):
+            buf.extend(chunk)
+            if len(buf) >= max_bytes:
+                truncated = True
+                process.terminate()
+                break
+
+    if truncated:
+        del buf[max_bytes:]
+    output = buf.decode("utf-8", errors="replace")
+    if truncated:
+        return output + "\n...[output truncated]"
+    if process.returncode != 0:
+        return f"Error: {output}"
+    return output
+
+def _ensure_parent(path):
+    """Create the parent directory of path if needed, without a separate exists check."""
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+def _url_key(url):
+    """Hash of a canonical form of url, so trivially different links to one page compare equal."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not k.startswith(_TRACKING_PARAMS)]
+    canon = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", urlencode(sorted(query)), ""))
+    return hashlib.blake2b(canon.encode(), digest_size=16).digest()
+
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
 
 def get_timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-class Agent:
-    def __init__(self, api_key=None, model="gpt-4-0613", additional_tools=None, kb_path="data/knowledge.db"):
-        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("API key must be provided or set as OPENAI_API_KEY environment variable")
-        self.model = model
-        self.additional_tools = additional_tools or []
-        self.client = OpenAI(api_key=self.api_key)
-        
-        # Initialize knowledge base and web processor
-        self.kb = KnowledgeBase(db_path=kb_path, api_key=self.api_key)
-        self.web_processor = WebProcessor()
+# Prime psutil's CPU counters so the first non-blocking sample measures the time since import
+psutil.cpu_percent(interval=None)
 
-        # Set up logging
-        self.logger = logging.getLogger('Agent')
-        self.logger.setLevel(logging.INFO)
-        log_file = os.path.join(os.getcwd(), 'agent.log')
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.INFO)
-        
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
-        
-        # Initialize task list
-        self.tasks = []
-        self.completed_tasks = []
-
-        # List of tools with added RAG capabilities
-        all_tools = [
-            {"type": "function", "function": {"name": "cmd", "description": "Runs a command on the system", "parameters": {"type": "object", "properties": {"command": {"type": "string", "description": "The command to run"}}, "required": ["command"]}}},
-            {"type": "function", "function": {"name": "file_operations", "description": "Performs file operations like read, write, list, or delete", "parameters": {"type": "object", "properties": {"operation": {"type": "string", "enum": ["read", "write", "list", "delete"], "description": "The operation to perform"}, "path": {"type": "string", "description": "The file or directory path"}, "content": {"type": "string", "description": "Content to write (for write operation)"}}, "required": ["operation", "path"]}}},
-            {"type": "function", "function": {"name": "system_info", "description": "Retrieves system information", "parameters": {"type": "object", "properties": {"info_type": {"type": "string", "enum": ["cpu", "memory", "disk", "network", "all"], "description": "Type of system information to retrieve"}}, "required": ["info_type"]}}},
-            {"type": "function", "function": {"name": "web_request", "description": "Sends a web request", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The URL to send the request to"}, "method": {"type": "string", "enum": ["GET", "POST"], "description": "The HTTP method to use"}, "data": {"type": "object", "description": "Data to send with the request (for POST)"}}, "required": ["url", "method"]}}},
-            {"type": "function", "function": {"name": "screenshot", "description": "Takes a screenshot of the screen", "parameters": {"type": "object", "properties": {"save_path": {"type": "string", "description": "Path to save the screenshot (optional)"}, "region": {"type": "string", "description": "Region to capture in format 'x,y,width,height' (optional)"}}, "required": []}}},
-            {"type": "function", "function": {"name": "browser", "description": "Opens the default web browser with a URL", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The URL to open in the browser"}}, "required": ["url"]}}},
-            {"type": "function", "function": {"name": "task_manager", "description": "Manages tasks and tracks progress", "parameters": {"type": "object", "properties": {"action": {"type": "string", "enum": ["add", "list", "complete", "delete"], "description": "The action to perform"}, "task_id": {"type": "integer", "description": "The ID of the task (for complete, delete actions)"}, "description": {"type": "string", "description": "Description of the task (for add action)"}}, "required": ["action"]}}},
-            {"type": "function", "function": {"name": "finish_task", "description": "Signals that the current task is finished", "parameters": {"type": "object", "properties": {"message": {"type": "string", "description": "A message summarizing task completion"}}, "required": ["message"]}}},
-            # Knowledge base tools
-            {"type": "function", "function": {"name": "kb_add", "description": "Add content to the knowledge base", "parameters": {"type": "object", "properties": {"content": {"type": "string", "description": "The content to add"}, "title": {"type": "string", "description": "Title for the content (optional)"}, "source": {"type": "string", "description": "Source of the content (optional)"}, "metadata": {"type": "object", "description": "Additional metadata (optional)"}}, "required": ["content"]}}},
-            {"type": "function", "function": {"name": "kb_retrieve", "description": "Retrieve a document from the knowledge base by ID", "parameters": {"type": "object", "properties": {"doc_id": {"type": "string", "description": "The ID of the document to retrieve"}}, "required": ["doc_id"]}}},
-            {"type": "function", "function": {"name": "kb_search", "description": "Search the knowledge base for documents matching a query", "parameters": {"type": "object", "properties": {"query": {"type": "string", "description": "The search query"}, "limit": {"type": "integer", "description": "Maximum number of results to return (default: 5)"}}, "required": ["query"]}}},
-            {"type": "function", "function": {"name": "kb_delete", "description": "Delete a document from the knowledge base", "parameters": {"type": "object", "properties": {"doc_id": {"type": "string", "description": "The ID of the document to delete"}}, "required": ["doc_id"]}}},
-            {"type": "function", "function": {"name": "kb_recent", "description": "Get the most recent documents added to the knowledge base", "parameters": {"type": "object", "properties": {"limit": {"type": "integer", "description": "Maximum number of documents to return (default: 10)"}}, "required": []}}},
-            {"type": "function", "function": {"name": "kb_stats", "description": "Get statistics about the knowledge base", "parameters": {"type": "object", "properties": {}, "required": []}}},
-            {"type": "function", "function": {"name": "web_scrape", "description": "Scrape content from a website and add it to the knowledge base", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The URL to scrape"}, "add_to_kb": {"type": "boolean", "description": "Whether to add the content to the knowledge base (default: true)"}}, "required": ["url"]}}},
-            {"type": "function", "function": {"name": "web_crawl", "description": "Crawl a website and add content to the knowledge base", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The starting URL to crawl"}, "max_pages": {"type": "integer", "description": "Maximum number of pages to crawl (default: 5)"}, "same_domain": {"type": "boolean", "description": "Only crawl pages on the same domain (default: true)"}}, "required": ["url"]}}},
-        ]
-        
-        self.assistant = self.client.beta.assistants.create(
-            name="Enhanced PC Agent with RAG",
-            instructions=f"""
+def _full_sys_info(cpu_percent):
+    """The system_info "all" payload, given a CPU usage sample."""
+    return _dumps({
+        "platform": platform.platform(),
+        "cpu": {"cpu_percent": cpu_percent, "cpu_count": psutil.cpu_count()},
+        "memory": dict(psutil.virtual_memory()._asdict()),
+        "disk": dict(psutil.disk_usage('/')._asdict()),
+        "network": dict(psutil.net_io_counters()._asdict())
+    })
+
+@functools.lru_cache(maxsize=1)
+def _static_sys_snapshot():
+    """System snapshot baked into the assistant instructions, taken once per process.
+
+    Uses a non-blocking cpu_percent sample so building an Agent does not
+    stall for a full second.
+    """
+    return _full_sys_info(psutil.cpu_percent(interval=None))
+
+# Tool schemas registered with the assistant, built once at import time
+_ASSISTANT_TOOLS = [
+    {"type": "function", "function": {"name": "cmd", "description": "Runs a command on the system", "parameters": {"type": "object", "properties": {"command": {"type": "string", "description": "The command to run"}}, "required": ["command"]}}},
+    {"type": "function", "function": {"name": "file_operations", "description": "Performs file operations like read, write, list, or delete", "parameters": {"type": "object", "properties": {"operation": {"type": "string", "enum": ["read", "write", "list", "delete"], "description": "The operation to perform"}, "path": {"type": "string", "description": "The file or directory path"}, "content": {"type": "string", "description": "Content to write (for write operation)"}}, "required": ["operation", "path"]}}},
+    {"type": "function", "function": {"name": "system_info", "description": "Retrieves system information", "parameters": {"type": "object", "properties": {"info_type": {"type": "string", "enum": ["cpu", "memory", "disk", "network", "all"], "description": "Type of system information to retrieve"}}, "required": ["info_type"]}}},
+    {"type": "function", "function": {"name": "web_request", "description": "Sends a web request", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The URL to send the request to"}, "method": {"type": "string", "enum": ["GET", "POST"], "description": "The HTTP method to use"}, "data": {"type": "object", "description": "Data to send with the request (for POST)"}}, "required": ["url", "method"]}}},
+    {"type": "function", "function": {"name": "screenshot", "description": "Takes a screenshot of the screen", "parameters": {"type": "object", "properties": {"save_path": {"type": "string", "description": "Path to save the screenshot (optional)"}, "region": {"type": "string", "description": "Region to capture in format 'x,y,width,height' (optional)"}}, "required": []}}},
+    {"type": "function", "function": {"name": "browser", "description": "Opens the default web browser with a URL", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The URL to open in the browser"}}, "required": ["url"]}}},
+    {"type": "function", "function": {"name": "task_manager", "description": "Manages tasks and tracks progress", "parameters": {"type": "object", "properties": {"action": {"type": "string", "enum": ["add", "list", "complete", "delete"], "description": "The action to perform"}, "task_id": {"type": "integer", "description": "The ID of the task (for complete, delete actions)"}, "description": {"type": "string", "description": "Description of the task (for add action)"}}, "required": ["action"]}}},
+    {"type": "function", "function": {"name": "finish_task", "description": "Signals that the current task is finished", "parameters": {"type": "object", "properties": {"message": {"type": "string", "description": "A message summarizing task completion"}}, "required": ["message"]}}},
+    # Knowledge base tools
+    {"type": "function", "function": {"name": "kb_add", "description": "Add content to the knowledge base", "parameters": {"type": "object", "properties": {"content": {"type": "string", "description": "The content to add"}, "title": {"type": "string", "description": "Title for the content (optional)"}, "source": {"type": "string", "description": "Source of the content (optional)"}, "metadata": {"type": "object", "description": "Additional metadata (optional)"}}, "required": ["content"]}}},
+    {"type": "function", "function": {"name": "kb_retrieve", "description": "Retrieve a document from the knowledge base by ID", "parameters": {"type": "object", "properties": {"doc_id": {"type": "string", "description": "The ID of the document to retrieve"}}, "required": ["doc_id"]}}},
+    {"type": "function", "function": {"name": "kb_search", "description": "Search the knowledge base for documents matching a query", "parameters": {"type": "object", "properties": {"query": {"type": "string", "description": "The search query"}, "limit": {"type": "integer", "description": "Maximum number of results to return (default: 5)"}}, "required": ["query"]}}},
+    {"type": "function", "function": {"name": "kb_delete", "description": "Delete a document from the knowledge base", "parameters": {"type": "object", "properties": {"doc_id": {"type": "string", "description": "The ID of the document to delete"}}, "required": ["doc_id"]}}},
+    {"type": "function", "function": {"name": "kb_recent", "description": "Get the most recent documents added to the knowledge base", "parameters": {"type": "object", "properties": {"limit": {"type": "integer", "description": "Maximum number of documents to return (default: 10)"}}, "required": []}}},
+    {"type": "function", "function": {"name": "kb_stats", "description": "Get statistics about the knowledge base", "parameters": {"type": "object", "properties": {}, "required": []}}},
+    {"type": "function", "function": {"name": "web_scrape", "description": "Scrape content from a website and add it to the knowledge base", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The URL to scrape"}, "add_to_kb": {"type": "boolean", "description": "Whether to add the content to the knowledge base (default: true)"}}, "required": ["url"]}}},
+    {"type": "function", "function": {"name": "web_crawl", "description": "Crawl a website and add content to the knowledge base", "parameters": {"type": "object", "properties": {"url": {"type": "string", "description": "The starting URL to crawl"}, "max_pages": {"type": "integer", "description": "Maximum number of pages to crawl (default: 5)"}, "same_domain": {"type": "boolean", "description": "Only crawl pages on the same domain (default: true)"}}, "required": ["url"]}}},
+]
+
+_ASSISTANT_INSTRUCTIONS = """
         You are an advanced AI agent designed to assist users with various PC-related tasks efficiently and accurately. You are equipped with a knowledge base that stores information from previous interactions and web scraping, allowing you to provide more informed and contextually relevant responses.
 
         Your primary goal is to provide quick, concise, and accurate step-by-step solutions to user queries. Follow these guidelines strictly:
@@ -131,50 +197,179 @@ class Agent:
         Remember, your role is to be a reliable, efficient, and safe assistant for PC-related tasks. Execute the task with caution however don't ask for confirmation for every single thing.
         
         Here is some additional information about the system currently and the current directory:
-        system information: {self.system_info("all")}
-        current directory: {os.getcwd()}
-        knowledge base document count: {self.kb.get_document_count()}
-            """,
+        system information: {sys_info}
+        current directory: {cwd}
+    """
+
+class Agent:
+    def __init__(self, api_key=None, model="gpt-4-0613", additional_tools=None, kb_path="data/knowledge.db"):
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("API key must be provided or set as OPENAI_API_KEY environment variable")
+        self.model = model
+        self.additional_tools = additional_tools or []
+        # Share one pooled HTTP/2 client so streams and tool-output submits reuse connections
+        self._http = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        self.client = AsyncOpenAI(api_key=self.api_key, http_client=self._http)
+
+        # Keep-alive session for the web_request tool
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50,
+                              max_retries=Retry(total=2, backoff_factor=0.3))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        
+        # Initialize knowledge base and web processor
+        self.kb = KnowledgeBase(db_path=kb_path, api_key=self.api_key)
+        self.web_processor = WebProcessor()
+
+        # Near-duplicate queries reuse RAG/search results; cleared whenever the KB changes
+        self._rag_cache = SemanticCache(maxsize=512, ttl=600, threshold=0.85)
+
+        # Set up logging
+        self.logger = logging.getLogger('Agent')
+        self.logger.setLevel(logging.INFO)
+        log_file = os.path.join(os.getcwd(), 'agent.log')
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(logging.INFO)
+        
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        file_handler.setFormatter(formatter)
+
+        # Records are queued here and written to disk by a background listener thread
+        log_queue = queue.Queue(-1)
+        self._log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+        self._log_listener.start()
+        self._log_handler = logging.handlers.QueueHandler(log_queue)
+        self.logger.addHandler(self._log_handler)
+        # Flush queued records even if the agent exits without aclose()
+        atexit.register(self._log_listener.stop)
+        
+        # Initialize task list (guarded by a lock as tools run on pool threads)
+        self.tasks = {}
+        self.completed_tasks = {}
+        self._task_ids = itertools.count(1)
+        self._task_lock = threading.Lock()
+
+        # Worker pool for running independent tool calls concurrently
+        self._tool_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+        # Sample CPU usage in the background so system_info never sleeps for it
+        self._cpu_percent = psutil.cpu_percent(interval=None)
+        self._stop_sampler = threading.Event()
+        self._cpu_sampler = threading.Thread(target=self._sample_cpu, name="cpu-sampler", daemon=True)
+        self._cpu_sampler.start()
+
+        # system_info results are reused for a few seconds
+        self._sysinfo_cache = TTLCache(maxsize=8, ttl=5)
+        self._sysinfo_lock = threading.Lock()
+        
+        # The assistant itself is created on first use from the running event loop
+        self.assistant = None
+        self._assistant_config = dict(
+            name="Enhanced PC Agent with RAG",
+            instructions=_ASSISTANT_INSTRUCTIONS.format(
+                sys_info=_static_sys_snapshot(),
+                cwd=os.getcwd()
+            ),
             model=model,
-            tools=all_tools
+            tools=_ASSISTANT_TOOLS
         )
         self.thread = None
         self.task_finished = False
 
+        # Tool name -> handler, looked up once per tool call
+        self._tool_table = {
+            "cmd": run_cmd,
+            "file_operations": self.file_operations,
+            "system_info": self.system_info,
+            "web_request": self.web_request,
+            "screenshot": self.screenshot,
+            "browser": self.browser,
+            "task_manager": self.task_manager,
+            "finish_task": self._finish_task,
+            # Knowledge base and web processing tools
+            "kb_add": self.kb_add,
+            "kb_retrieve": self.kb_retrieve,
+            "kb_search": self.kb_search,
+            "kb_delete": self.kb_delete,
+            "kb_recent": self.kb_recent,
+            "kb_stats": self.kb_stats,
+            "web_scrape": self.web_scrape,
+            "web_crawl": self.web_crawl,
+        }
+
+    async def aclose(self):
+        """Release the tool worker pool and pooled HTTP connections."""
+        self._stop_sampler.set()
+        self._tool_pool.shutdown(wait=False)
+        self._session.close()
+        atexit.unregister(self._log_listener.stop)
+        self.logger.removeHandler(self._log_handler)
+        self._log_listener.stop()
+        self.kb.close()
+        self.web_processor.close()
+        await self.client.close()
+
+    def _sample_cpu(self):
+        # Each non-blocking call reports usage since the previous one, i.e. over the last second
+        while not self._stop_sampler.wait(1.0):
+            self._cpu_percent = psutil.cpu_percent(interval=None)
+
     def log_and_print(self, message):
         timestamp = get_timestamp()
         full_message = f"[{timestamp}] {message}"
         self.logger.info(message)
         print(full_message)
 
-    def file_operations(self, operation, path, content=None):
+    def file_operations(self, operation, path, content=None, max_bytes=1_048_576):
         try:
             if operation == "read":
-                with open(path, 'r') as file:
-                    return file.read()
+                buf = bytearray()
+                truncated = False
+                with open(path, 'rb') as file:
+                    # For files known to be over the cap, return the head and the tail
+                    if os.fstat(file.fileno()).st_size > max_bytes:
+                        head = file.read(max_bytes // 2)
+                        file.seek(-(max_bytes - max_bytes // 2), os.SEEK_END)
+                        tail = file.read()
+                        return (head.decode('utf-8', errors='replace') + "\n...[truncated]...\n"
+                                + tail.decode('utf-8', errors='replace'))
+                    
+                    # Otherwise read in 64 KiB chunks, still capped for pipes and pseudo-files
+                    while True:
+                        chunk = file.read(65536)
+                        if not chunk:
+                            break
+                        buf.extend(chunk)
+                        if len(buf) >= max_bytes:
+                            truncated = len(buf) > max_bytes or bool(file.read(1))
+                            del buf[max_bytes:]
+                            break
+                text = buf.decode('utf-8', errors='replace')
+                return text + "\n...[truncated]" if truncated else text
             elif operation == "write":
-                # Create directory if it doesn't exist
-                directory = os.path.dirname(path)
-                if directory and not os.path.exists(directory):
-                    os.makedirs(directory)
+                _ensure_parent(path)
                     
                 with open(path, 'w') as file:
                     file.write(content)
                 return f"Successfully wrote to {path}"
             elif operation == "list":
-                items = os.listdir(path)
-                result = []
-                for item in items:
-                    item_path = os.path.join(path, item)
-                    if os.path.isdir(item_path):
-                        result.append(f"[dir] {item}")
-                    else:
-                        size = os.path.getsize(item_path)
-                        result.append(f"[file] {item} ({self._format_size(size)})")
-                return '\n'.join(result)
+                # scandir yields the entry type with each dirent, so only files need a stat
+                with os.scandir(path) as entries:
+                    return '\n'.join([
+                        f"[dir] {entry.name}" if entry.is_dir()
+                        else f"[file] {entry.name} ({self._format_size(entry.stat().st_size)})"
+                        for entry in entries
+                    ])
             elif operation == "delete":
-                if os.path.isdir(path):
-                    os.rmdir(path)
+                # One lstat decides the branch; symlinks are removed, never followed
+                if stat.S_ISDIR(os.lstat(path).st_mode):
+                    shutil.rmtree(path)
                     return f"Successfully deleted directory {path}"
                 else:
                     os.remove(path)
@@ -184,109 +379,120 @@ class Agent:
     
     def _format_size(self, size_bytes):
         """Format file size in a human-readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if size_bytes < 1024.0 or unit == 'TB':
-                return f"{size_bytes:.2f}{unit}" if unit != 'B' else f"{size_bytes}B"
-            size_bytes /= 1024.0
+        # Each unit is 10 bits wide, so the bit length picks the unit directly
+        unit_idx = min((size_bytes.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1) if size_bytes > 0 else 0
+        if unit_idx == 0:
+            return f"{size_bytes}B"
+        return f"{size_bytes / (1 << (10 * unit_idx)):.2f}{_SIZE_UNITS[unit_idx]}"
 
     def system_info(self, info_type):
+        with self._sysinfo_lock:
+            info = self._sysinfo_cache.get(info_type)
+            if info is None:
+                info = self._collect_system_info(info_type)
+                if info is not None:
+                    self._sysinfo_cache[info_type] = info
+        return info
+
+    def _collect_system_info(self, info_type):
         if info_type == "cpu":
-            return json.dumps({"cpu_percent": psutil.cpu_percent(interval=1), "cpu_count": psutil.cpu_count()})
+            return _dumps({"cpu_percent": self._cpu_percent, "cpu_count": psutil.cpu_count()})
         elif info_type == "memory":
             mem = psutil.virtual_memory()
-            return json.dumps({"total": mem.total, "available": mem.available, "percent": mem.percent})
+            return _dumps({"total": mem.total, "available": mem.available, "percent": mem.percent})
         elif info_type == "disk":
             disk = psutil.disk_usage('/')
-            return json.dumps({"total": disk.total, "used": disk.used, "free": disk.free, "percent": disk.percent})
+            return _dumps({"total": disk.total, "used": disk.used, "free": disk.free, "percent": disk.percent})
         elif info_type == "network":
             net_io = psutil.net_io_counters()
-            return json.dumps({"bytes_sent": net_io.bytes_sent, "bytes_recv": net_io.bytes_recv})
+            return _dumps({"bytes_sent": net_io.bytes_sent, "bytes_recv": net_io.bytes_recv})
         elif info_type == "all":
-            return json.dumps({
-                "platform": platform.platform(),
-                "cpu": {"cpu_percent": psutil.cpu_percent(interval=1), "cpu_count": psutil.cpu_count()},
-                "memory": dict(psutil.virtual_memory()._asdict()),
-                "disk": dict(psutil.disk_usage('/')._asdict()),
-                "network": dict(psutil.net_io_counters()._asdict())
-            })
+            return _full_sys_info(self._cpu_percent)
 
     def web_request(self, url, method, data=None):
         try:
             if method == "GET":
-                response = requests.get(url)
+                response = self._session.get(url, timeout=10)
             elif method == "POST":
-                response = requests.post(url, json=data)
+                response = self._session.post(url, json=data, timeout=30)
             return f"Status Code: {response.status_code}, Content: {response.text[:500]}"
         except Exception as e:
             return f"Error in web request: {str(e)}"
 
     def screenshot(self, save_path=None, region=None):
         try:
-            if region:
-                # Parse region string "x,y,width,height"
-                x, y, width, height = map(int, region.split(','))
-                screen_img = pyautogui.screenshot(region=(x, y, width, height))
-            else:
-                screen_img = pyautogui.screenshot()
+            # Imported on first use; screen capture backends are slow to load
+            import mss
+            import mss.tools
+
+            with mss.mss() as sct:
+                if region:
+                    # Parse region string "x,y,width,height"
+                    x, y, width, height = map(int, region.split(','))
+                    monitor = {"left": x, "top": y, "width": width, "height": height}
+                else:
+                    monitor = sct.monitors[1]
+                screen_img = sct.grab(monitor)
             
             if save_path:
-                # Create directory if it doesn't exist
-                directory = os.path.dirname(save_path)
-                if directory and not os.path.exists(directory):
-                    os.makedirs(directory)
+                _ensure_parent(save_path)
                     
-                screen_img.save(save_path)
+                # Encode exactly once, with fast zlib settings, and write the bytes directly
+                png_bytes = mss.tools.to_png(screen_img.rgb, screen_img.size, level=1)
+                pathlib.Path(save_path).write_bytes(png_bytes)
                 return f"Screenshot saved to {save_path}"
             
-            # Return a base64-encoded image for immediate display/use
-            buffered = io.BytesIO()
-            screen_img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            return f"Screenshot captured (not saved). Base64 encoding (first 100 chars): {img_str[:100]}..."
+            # Nothing consumes the pixels when unsaved, so skip PNG and base64 encoding
+            return f"Screenshot captured (not saved): {screen_img.width}x{screen_img.height}, {screen_img.width * screen_img.height * 3} bytes"
         except Exception as e:
             return f"Error taking screenshot: {str(e)}"
 
     def browser(self, url):
         try:
+            import webbrowser
+
             webbrowser.open(url)
             return f"Opened URL in browser: {url}"
         except Exception as e:
             return f"Error opening URL in browser: {str(e)}"
 
     def task_manager(self, action, task_id=None, description=None):
+        with self._task_lock:
+            return self._task_manager(action, task_id, description)
+
+    def _task_manager(self, action, task_id=None, description=None):
         try:
             if action == "add":
                 if not description:
                     return "Error: Task description is required for 'add' action."
-                new_id = len(self.tasks) + len(self.completed_tasks) + 1
+                new_id = next(self._task_ids)
                 task = {"id": new_id, "description": description, "created_at": get_timestamp()}
-                self.tasks.append(task)
+                self.tasks[new_id] = task
                 return f"Task #{new_id} added: {description}"
             
             elif action == "list":
                 if not self.tasks and not self.completed_tasks:
                     return "No tasks found."
                 
-                result = "Active Tasks:\n"
-                for task in self.tasks:
-                    result += f"#{task['id']}: {task['description']} (Created: {task['created_at']})\n"
-                
-                result += "\nCompleted Tasks:\n"
-                for task in self.completed_tasks:
-                    result += f"#{task['id']}: {task['description']} (Completed: {task.get('completed_at', 'Unknown')})\n"
+                lines = ["Active Tasks:"]
+                lines.extend(f"#{task['id']}: {task['description']} (Created: {task['created_at']})"
+                             for task in self.tasks.values())
+                lines.append("")
+                lines.append("Completed Tasks:")
+                lines.extend(f"#{task['id']}: {task['description']} (Completed: {task.get('completed_at', 'Unknown')})"
+                             for task in self.completed_tasks.values())
                 
-                return result
+                return "\n".join(lines) + "\n"
             
             elif action == "complete":
                 if not task_id:
                     return "Error: Task ID is required for 'complete' action."
                 
-                for i, task in enumerate(self.tasks):
-                    if task["id"] == task_id:
-                        task["completed_at"] = get_timestamp()
-                        self.completed_tasks.append(task)
-                        self.tasks.pop(i)
-                        return f"Task #{task_id} marked as completed."
+                task = self.tasks.pop(task_id, None)
+                if task:
+                    task["completed_at"] = get_timestamp()
+                    self.completed_tasks[task_id] = task
+                    return f"Task #{task_id} marked as completed."
                 
                 return f"Error: Task #{task_id} not found."
             
@@ -294,15 +500,11 @@ class Agent:
                 if not task_id:
                     return "Error: Task ID is required for 'delete' action."
                 
-                for i, task in enumerate(self.tasks):
-                    if task["id"] == task_id:
-                        self.tasks.pop(i)
-                        return f"Task #{task_id} deleted."
+                if self.tasks.pop(task_id, None):
+                    return f"Task #{task_id} deleted."
                 
-                for i, task in enumerate(self.completed_tasks):
-                    if task["id"] == task_id:
-                        self.completed_tasks.pop(i)
-                        return f"Completed task #{task_id} deleted."
+                if self.completed_tasks.pop(task_id, None):
+                    return f"Completed task #{task_id} deleted."
                 
                 return f"Error: Task #{task_id} not found."
             
@@ -317,6 +519,7 @@ class Agent:
         """Add content to the knowledge base."""
         try:
             doc_id = self.kb.add_document(content, title, source, metadata)
+            self._rag_cache.clear()
             return f"Added document to knowledge base with ID: {doc_id}"
         except Exception as e:
             return f"Error adding to knowledge base: {str(e)}"
@@ -326,7 +529,7 @@ class Agent:
         try:
             doc = self.kb.retrieve_document(doc_id)
             if doc:
-                return json.dumps(doc)
+                return _dumps(doc)
             return "Document not found"
         except Exception as e:
             return f"Error retrieving from knowledge base: {str(e)}"
@@ -334,11 +537,24 @@ class Agent:
     def kb_search(self, query, limit=5):
         """Search the knowledge base for documents matching a query."""
         try:
+            query_embedding = self.kb.embed_query(query)
+            generation = self._rag_cache.generation
+            cached = self._rag_cache.get(("kb_search", limit), query_embedding)
+            if cached is not None:
+                return cached
+            
             # First try semantic search
-            semantic_results = self.kb.retrieve_similar(query, limit=limit)
+            semantic_results = self.kb.retrieve_similar(query, limit=limit, query_embedding=query_embedding)
+            
+            # Semantic results are enough when the best match is strong, or when
+            # there is a full page of them that are all at least loosely related
+            semantic_sufficient = semantic_results and (
+                semantic_results[0]['similarity'] >= 0.6
+                or (len(semantic_results) >= limit and semantic_results[-1]['similarity'] > 0.3)
+            )
             
-            # If no good semantic results, try keyword search
-            if not semantic_results or semantic_results[0]['similarity'] < 0.6:
+            # Otherwise fall back to keyword search
+            if not semantic_sufficient:
                 keyword_results = self.kb.search_documents(query, limit=limit)
                 
                 # Combine results, prioritizing semantic matches
@@ -348,9 +564,7 @@ class Agent:
                         doc['similarity'] = 0  # Add a similarity score for consistent output
                         combined[doc['id']] = doc
                 
-                results = list(combined.values())
-                results.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-                results = results[:limit]
+                results = heapq.nlargest(limit, combined.values(), key=lambda x: x.get('similarity', 0))
             else:
                 results = semantic_results
             
@@ -359,8 +573,8 @@ class Agent:
             
             formatted_results = []
             for doc in results:
-                # Truncate content for readability
-                doc_content = doc['content']
+                # Truncate content for readability, previewing the best matching chunk when there is one
+                doc_content = doc.get('chunk') or doc['content']
                 if len(doc_content) > 300:
                     doc_content = doc_content[:300] + "..."
                 
@@ -372,7 +586,9 @@ class Agent:
                     "source": doc.get('source', 'Unknown')
                 })
             
-            return json.dumps(formatted_results)
+            output = _dumps(formatted_results)
+            self._rag_cache.put(("kb_search", limit), query, query_embedding, output, generation)
+            return output
         except Exception as e:
             return f"Error searching knowledge base: {str(e)}"
     
@@ -381,6 +597,7 @@ class Agent:
         try:
             success = self.kb.delete_document(doc_id)
             if success:
+                self._rag_cache.clear()
                 return f"Document {doc_id} deleted from knowledge base"
             return f"Document {doc_id} not found"
         except Exception as e:
@@ -408,7 +625,7 @@ class Agent:
                     "created_at": doc['created_at']
                 })
             
-            return json.dumps(formatted_docs)
+            return _dumps(formatted_docs)
         except Exception as e:
             return f"Error retrieving recent documents: {str(e)}"
     
@@ -416,7 +633,7 @@ class Agent:
         """Get statistics about the knowledge base."""
         try:
             doc_count = self.kb.get_document_count()
-            return json.dumps({
+            return _dumps({
                 "document_count": doc_count,
                 "knowledge_base_path": self.kb.db_path
             })
@@ -441,6 +658,7 @@ class Agent:
                     metadata=processed_data['metadata']
                 )
                 result += f"\nAdded to knowledge base with ID: {doc_id}"
+                self._rag_cache.clear()
                 
                 # Return a preview of the content
                 content_preview = processed_data['content']
@@ -461,46 +679,52 @@ class Agent:
             if not html_content:
                 return f"Failed to access {url}"
             
-            # Process the initial page
-            processed_data = self.web_processor.process_url(url)
+            # Pages are collected here and stored with one batched embedding request
+            pending_docs = []
+            
+            # Process the initial page (already fetched above) and collect its links in the same parse
+            processed_data = self.web_processor.process_html(html_content, url, include_links=True)
             if processed_data and processed_data['content']:
-                doc_id = self.kb.add_document(
-                    content=processed_data['content'],
-                    title=processed_data['title'],
-                    source=url,
-                    metadata=processed_data['metadata']
-                )
+                pending_docs.append({
+                    "content": processed_data['content'],
+                    "title": processed_data['title'],
+                    "source": url,
+                    "metadata": processed_data['metadata']
+                })
             
-            # Extract links from the initial page
-            links = self.web_processor.extract_links(html_content, url)
+            links = processed_data['links']
             
-            # Track processed links
-            processed_links = {url}
+            # Track processed links by canonical URL hash
+            processed_links = {_url_key(url)}
             results = [f"Added initial page {url} to knowledge base"]
             
-            # Process additional pages up to max_pages
-            page_count = 1
+            # Queue each unseen link once
+            pending_links = []
             for link in links:
-                if page_count >= max_pages:
-                    break
-                    
-                if link in processed_links:
-                    continue
-                    
-                processed_links.add(link)
-                
-                # Process the linked page
-                link_data = self.web_processor.process_url(link)
-                if link_data and link_data['content']:
-                    doc_id = self.kb.add_document(
-                        content=link_data['content'],
-                        title=link_data['title'],
-                        source=link,
-                        metadata=link_data['metadata']
-                    )
-                    results.append(f"Added page {link} to knowledge base")
-                    page_count += 1
+                key = _url_key(link)
+                if key not in processed_links:
+                    processed_links.add(key)
+                    pending_links.append(link)
+            
+            # Fetch linked pages concurrently, one wave per number of pages still needed,
+            # until max_pages have content or the links run out
+            page_count = 1
+            while page_count < max_pages and pending_links:
+                wave = max_pages - page_count
+                batch, pending_links = pending_links[:wave], pending_links[wave:]
+                for link, link_data in zip(batch, asyncio.run(self.web_processor.aprocess_urls(batch))):
+                    if link_data and link_data['content']:
+                        pending_docs.append({
+                            "content": link_data['content'],
+                            "title": link_data['title'],
+                            "source": link,
+                            "metadata": link_data['metadata']
+                        })
+                        results.append(f"Added page {link} to knowledge base")
+                        page_count += 1
             
+            self.kb.add_documents(pending_docs)
+            self._rag_cache.clear()
             return "\n".join(results) + f"\nCrawl completed: processed {page_count} pages."
         except Exception as e:
             return f"Error during web crawl: {str(e)}"
@@ -508,15 +732,92 @@ class Agent:
     def get_rag_context(self, query):
         """Get RAG context for a query to enhance responses."""
         try:
-            context, used_docs = self.kb.get_rag_context(query)
+            query_embedding = self.kb.embed_query(query)
+            generation = self._rag_cache.generation
+            cached = self._rag_cache.get("rag", query_embedding)
+            if cached is not None:
+                return cached
+            
+            context, used_docs = self.kb.get_rag_context(query, query_embedding=query_embedding)
+            self._rag_cache.put("rag", query, query_embedding, (context, used_docs), generation)
             return context, used_docs
         except Exception as e:
             self.log_and_print(f"Error getting RAG context: {str(e)}")
             return "", []
 
-    def autobot(self):
+    def _finish_task(self, message):
+        self.task_finished = True
+        return f"Task finished: {message}"
+
+    def _dispatch_tool(self, function_name, function_args):
+        handler = self._tool_table.get(function_name)
+        if handler is None:
+            return f"Unknown function: {function_name}"
+        return handler(**function_args)
+
+    async def _run_tool_calls(self, tool_calls):
+        """Run one batch of tool calls concurrently, returning outputs in call order."""
+        loop = asyncio.get_running_loop()
+
+        # Blocking tools go to the worker pool so they overlap each other;
+        # finish_task mutates agent state and stays on the event loop
+        calls = []
+        for tool_call in tool_calls:
+            function_name = tool_call.function.name
+            function_args = _loads(tool_call.function.arguments)
+            if function_name == "finish_task":
+                future = loop.create_future()
+                future.set_result(self._dispatch_tool(function_name, function_args))
+            else:
+                future = loop.run_in_executor(self._tool_pool, self._dispatch_tool, function_name, function_args)
+            calls.append((tool_call, function_name, function_args, future))
+
+        outputs = await asyncio.gather(*(future for _, _, _, future in calls))
+
+        tool_outputs = []
+        for (tool_call, function_name, function_args, _), output in zip(calls, outputs):
+            self.log_and_print(f"Executing {function_name}: {function_args}")
+            self.log_and_print(f"Output: {output}")
+
+            tool_outputs.append({
+                "tool_call_id": tool_call.id,
+                "output": output
+            })
+        return tool_outputs
+
+    async def _consume_run_stream(self, stream, replies):
+        """Drain a run event stream, returning the follow-up stream if tools were called.
+
+        Completed assistant messages are printed as they arrive and appended to replies.
+        """
+        async with stream as events:
+            async for event in events:
+                if event.event == "thread.message.completed" and event.data.role == "assistant":
+                    assistant_response = "".join(
+                        part.text.value for part in event.data.content if part.type == "text"
+                    )
+                    self.log_and_print(f"Assistant: {assistant_response}")
+                    replies.append(assistant_response)
+                    continue
+
+                if event.event != "thread.run.requires_action":
+                    continue
+
+                run = event.data
+                tool_outputs = await self._run_tool_calls(run.required_action.submit_tool_outputs.tool_calls)
+
+                return self.client.beta.threads.runs.submit_tool_outputs_stream(
+                    thread_id=self.thread.id,
+                    run_id=run.id,
+                    tool_outputs=tool_outputs
+                )
+        return None
+
+    async def autobot(self):
+        if not self.assistant:
+            self.assistant = await self.client.beta.assistants.create(**self._assistant_config)
         if not self.thread:
-            self.thread = self.client.beta.threads.create()
+            self.thread = await self.client.beta.threads.create()
         
         self.log_and_print("Enhanced PC Agent with RAG is running. Type 'exit' to quit.")
         while True:
@@ -524,14 +825,14 @@ class Agent:
                 self.log_and_print("Task finished. Agent is exiting.")
                 break
 
-            user_input = input("You: ")
+            user_input = await asyncio.to_thread(input, "You: ")
             if user_input.lower() == 'exit':
                 break
 
             self.log_and_print(f"User: {user_input}")
             
             # Get RAG context for the query
-            rag_context, used_docs = self.get_rag_context(user_input)
+            rag_context, used_docs = await asyncio.to_thread(self.get_rag_context, user_input)
             
             # Combine user input with RAG context if available
             if rag_context:
@@ -540,98 +841,37 @@ class Agent:
             else:
                 enhanced_input = user_input
 
-            self.client.beta.threads.messages.create(
+            await self.client.beta.threads.messages.create(
                 thread_id=self.thread.id,
                 role="user",
                 content=enhanced_input
             )
-            run = self.client.beta.threads.runs.create(
+            stream = self.client.beta.threads.runs.stream(
                 thread_id=self.thread.id,
                 assistant_id=self.assistant.id
             )
 
-            while run.status not in ["completed", "failed"]:
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=self.thread.id,
-                    run_id=run.id
-                )
-                if run.status == "requires_action":
-                    tool_calls = run.required_action.submit_tool_outputs.tool_calls
-                    tool_outputs = []
-                    for tool_call in tool_calls:
-                        function_name = tool_call.function.name
-                        function_args = json.loads(tool_call.function.arguments)
-                        
-                        if function_name == "cmd":
-                            output = run_cmd(function_args["command"])
-                        elif function_name == "file_operations":
-                            output = self.file_operations(**function_args)
-                        elif function_name == "system_info":
-                            output = self.system_info(function_args["info_type"])
-                        elif function_name == "web_request":
-                            output = self.web_request(**function_args)
-                        elif function_name == "screenshot":
-                            output = self.screenshot(**function_args)
-                        elif function_name == "browser":
-                            output = self.browser(**function_args)
-                        elif function_name == "task_manager":
-                            output = self.task_manager(**function_args)
-                        elif function_name == "finish_task":
-                            self.task_finished = True
-                            output = f"Task finished: {function_args['message']}"
-                        # Knowledge base and web processing tools
-                        elif function_name == "kb_add":
-                            output = self.kb_add(**function_args)
-                        elif function_name == "kb_retrieve":
-                            output = self.kb_retrieve(**function_args)
-                        elif function_name == "kb_search":
-                            output = self.kb_search(**function_args)
-                        elif function_name == "kb_delete":
-                            output = self.kb_delete(**function_args)
-                        elif function_name == "kb_recent":
-                            output = self.kb_recent(**function_args)
-                        elif function_name == "kb_stats":
-                            output = self.kb_stats()
-                        elif function_name == "web_scrape":
-                            output = self.web_scrape(**function_args)
-                        elif function_name == "web_crawl":
-                            output = self.web_crawl(**function_args)
-                        else:
-                            output = f"Unknown function: {function_name}"
-
-                        self.log_and_print(f"Executing {function_name}: {function_args}")
-                        self.log_and_print(f"Output: {output}")
-                        
-                        tool_outputs.append({
-                            "tool_call_id": tool_call.id,
-                            "output": output
-                        })
+            # Consume run events as they arrive; submitting tool outputs
+            # continues the run on a fresh stream until nothing is pending
+            replies = []
+            while stream is not None:
+                stream = await self._consume_run_stream(stream, replies)
 
-                    self.client.beta.threads.runs.submit_tool_outputs(
-                        thread_id=self.thread.id,
-                        run_id=run.id,
-                        tool_outputs=tool_outputs
-                    )
-                
-                # Sleep briefly to avoid excessive API calls
-                time.sleep(0.5)
+            # Log the conversation with context used
+            if rag_context and replies:
+                assistant_response = "\n\n".join(replies)
+                await asyncio.to_thread(self.kb.log_conversation, user_input, assistant_response, used_docs)
 
-            messages = self.client.beta.threads.messages.list(thread_id=self.thread.id)
-            for message in reversed(messages.data):
-                if message.role == "assistant":
-                    assistant_response = message.content[0].text.value
-                    self.log_and_print(f"Assistant: {assistant_response}")
-                    
-                    # Log the conversation with context used
-                    if rag_context:
-                        self.kb.log_conversation(user_input, assistant_response, used_docs)
-                    
-                    break
 
+async def run_agent():
+    agent = Agent()  # Will use OPENAI_API_KEY environment variable
+    try:
+        await agent.autobot()
+    finally:
+        await agent.aclose()
 
 def main():
-    agent = Agent()  # Will use OPENAI_API_KEY environment variable
-    agent.autobot()
+    asyncio.run(run_agent())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
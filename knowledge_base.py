@@ -4,9 +4,184 @@ import sqlite3
 import numpy as np
 from datetime import datetime
 import hashlib
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import uuid
+import threading
+import contextlib
+import asyncio
+import functools
 from pathlib import Path
+from collections import OrderedDict
+from cachetools import TTLCache
+
+# orjson is optional; it speeds up metadata, tool payload and traffic log encoding.
+# agent.py and scraper.py import these helpers from here.
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# FAISS is optional; without it similarity search falls back to a numpy scan
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# sqlite-vec is optional; without FAISS it keeps a KNN virtual table inside the database
+try:
+    import sqlite_vec
+except ImportError:
+    sqlite_vec = None
+
+# numba is optional; it scores the int8 matrix in parallel without an int32 copy of it per query
+try:
+    import numba
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _int8_scores(matrix, query, scales, query_scale):
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for i in numba.prange(matrix.shape[0]):
+            acc = np.int32(0)
+            for j in range(matrix.shape[1]):
+                acc += np.int32(matrix[i, j]) * np.int32(query[j])
+            scores[i] = acc * scales[i] * query_scale
+        return scores
+except ImportError:
+    _int8_scores = None
+
+# tiktoken is optional; without it chunk sizes are estimated from word counts
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Documents are embedded in overlapping windows of this many tokens
+_CHUNK_TOKENS = 500
+_CHUNK_OVERLAP = 50
+
+# Rows upcast at once when scoring the int8 matrix without numba
+_SCORE_BLOCK_ROWS = 4096
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """Tokenizer used by the text-embedding-3 and gpt-4 models, or None if tiktoken is unusable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The encoding file is downloaded on first use, which fails offline
+        return None
+
+@functools.lru_cache(maxsize=1024)
+def _token_ids(text):
+    # Retrieved chunks recur across RAG calls, so their encodings are memoized
+    return tuple(_encoding().encode(text))
+
+def _chunk_text(text):
+    """Split text into overlapping windows of about _CHUNK_TOKENS tokens."""
+    step = _CHUNK_TOKENS - _CHUNK_OVERLAP
+    
+    if _encoding() is not None:
+        tokens = _encoding().encode(text)
+        if len(tokens) <= _CHUNK_TOKENS:
+            return [text]
+        return [_encoding().decode(tokens[i:i + _CHUNK_TOKENS]) for i in range(0, len(tokens) - _CHUNK_OVERLAP, step)]
+    
+    # Roughly 3 words per 4 tokens
+    words = text.split()
+    size, step = _CHUNK_TOKENS * 3 // 4, step * 3 // 4
+    if len(words) <= size:
+        return [text]
+    return [" ".join(words[i:i + size]) for i in range(0, len(words) - (size - step), step)]
+
+# Document fields returned to callers (the dedup hash columns stay internal)
+_DOC_COLUMNS = "id, title, content, source, metadata, created_at, accessed_at, access_count"
+
+def _simhash(text):
+    """64-bit SimHash over word trigrams, as a signed integer for SQLite.
+
+    Texts differing only in whitespace, case or a few words are a few bits apart.
+    """
+    words = text.lower().split()
+    if not words:
+        return 0
+    
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little") for shingle in shingles],
+        dtype=np.uint64
+    )
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    fingerprint = sum(1 << i for i, count in enumerate(bits.sum(axis=0)) if count * 2 > len(shingles))
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+def _hamming(a, b):
+    if a is None or b is None:
+        return None
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+def _quantize(embedding):
+    """Unit-normalize an embedding and encode it as int8 bytes with a per-vector scale.
+
+    Returns (blob, scale) where component ~= int8 value * scale.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector = vector / (np.linalg.norm(vector) or 1.0)
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.round(vector / scale).astype(np.int8).tobytes(), scale
+
+def _dequantize(blob, scale):
+    """Decode an int8 embedding blob back to an (approximately unit) float32 vector."""
+    return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale
+
+class SemanticCache:
+    def __init__(self, maxsize=512, ttl=600, threshold=0.85):
+        """Cache results by query embedding, so near-duplicate queries share an entry.
+
+        Entries expire after ttl seconds and the least recently used are evicted
+        beyond maxsize. Embeddings must be unit length.
+        """
+        self.threshold = threshold
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # Bumped by clear(), so results computed before a knowledge base change are not stored
+        self.generation = 0
+    
+    def get(self, namespace, embedding):
+        """Return the cached value for the most similar query in namespace, or None."""
+        with self._lock:
+            best_key = None
+            best_similarity = self.threshold
+            for key, (cached_embedding, _) in list(self._entries.items()):
+                if key[0] != namespace:
+                    continue
+                similarity = float(np.dot(embedding, cached_embedding))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            
+            if best_key is None:
+                return None
+            # Indexing refreshes the entry's LRU position
+            return self._entries[best_key][1]
+    
+    def put(self, namespace, query, embedding, value, generation=None):
+        """Store value, unless generation (read before computing it) is older than the last clear()."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[(namespace, query)] = (embedding, value)
+    
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
 
 class KnowledgeBase:
     def __init__(self, db_path="knowledge.db", embedding_model="text-embedding-3-small", api_key=None):
@@ -19,17 +194,63 @@ class KnowledgeBase:
         
         self.client = OpenAI(api_key=self.api_key)
         
+        # Query embeddings keyed by SHA-256 of the cleaned text, least recently used evicted first
+        self._embedding_cache = OrderedDict()
+        self._embedding_cache_size = 1024
+        self._embedding_cache_lock = threading.Lock()
+        
         # Create data directory if it doesn't exist
         data_dir = os.path.dirname(db_path)
         if data_dir and not os.path.exists(data_dir):
             os.makedirs(data_dir)
         
+        # One long-lived connection shared by all methods; the lock serializes its use across threads
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript(
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA cache_size=-65536; "
+            "PRAGMA temp_store=MEMORY; PRAGMA mmap_size=268435456;"
+        )
+        self._db_lock = threading.RLock()
+        self.conn.create_function("HAMMING", 2, _hamming, deterministic=True)
+        
+        # Use sqlite-vec for similarity search when FAISS is not installed
+        self._vec = faiss is None and sqlite_vec is not None
+        if self._vec:
+            try:
+                self.conn.enable_load_extension(True)
+                sqlite_vec.load(self.conn)
+                self.conn.enable_load_extension(False)
+            except (AttributeError, sqlite3.Error):
+                # This sqlite3 build cannot load extensions; fall back to the numpy scan
+                self._vec = False
+        
         # Initialize database
         self._init_db()
+        
+        # Vector index over the embeddings table, keyed by embeddings.rowid
+        self.index_path = os.path.splitext(db_path)[0] + ".faiss"
+        self._index = None
+        self._index_dirty = False
+        self._index_version = 0
+        self._index_lock = threading.Lock()
+        
+        # Without FAISS, the int8 embedding matrix is cached in memory for brute-force scans
+        # (built on first search, then kept in step with inserts and deletes)
+        self._emb_matrix = None
+        self._emb_scales = None
+        self._emb_rowids = None
+        self._load_index()
+        self._load_vec()
+    
+    @contextlib.contextmanager
+    def _connect(self):
+        """Hold the shared connection for one transaction (committed on exit, rolled back on error)."""
+        with self._db_lock, self.conn:
+            yield self.conn
     
     def _init_db(self):
         """Initialize the SQLite database with necessary tables."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Create documents table
@@ -57,6 +278,10 @@ class KnowledgeBase:
             )
             ''')
             
+            # Counters: embeddings_version changes with every embeddings write,
+            # faiss_version records the embeddings_version the saved FAISS index reflects
+            cursor.execute("CREATE TABLE IF NOT EXISTS kb_meta (key TEXT PRIMARY KEY, value INTEGER)")
+            
             # Create conversations table
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS conversations (
@@ -68,13 +293,232 @@ class KnowledgeBase:
             )
             ''')
             
+            # Indexes for recency ordering and the embeddings -> documents join
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_docs_created_at ON documents(created_at DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_emb_docid ON embeddings(document_id)")
+            
+            self._migrate(cursor)
+            self._init_fts(cursor)
+            
             conn.commit()
     
+    def _init_fts(self, cursor):
+        """Create the trigram full-text index used by search_documents, kept in sync by triggers."""
+        exists = "SELECT 1 FROM sqlite_master WHERE name = 'docs_fts'"
+        if not cursor.execute(exists).fetchone():
+            try:
+                cursor.executescript('''
+                CREATE VIRTUAL TABLE docs_fts USING fts5(
+                    title, content, content='documents', content_rowid='rowid', tokenize='trigram'
+                );
+                CREATE TRIGGER docs_fts_insert AFTER INSERT ON documents BEGIN
+                    INSERT INTO docs_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+                END;
+                CREATE TRIGGER docs_fts_delete AFTER DELETE ON documents BEGIN
+                    INSERT INTO docs_fts(docs_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+                END;
+                CREATE TRIGGER docs_fts_update AFTER UPDATE OF title, content ON documents BEGIN
+                    INSERT INTO docs_fts(docs_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+                    INSERT INTO docs_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+                END;
+                INSERT INTO docs_fts(docs_fts) VALUES ('rebuild');
+                ''')
+            except sqlite3.OperationalError:
+                # SQLite without FTS5/trigram support; search_documents keeps using LIKE
+                pass
+        
+        self._fts = cursor.execute(exists).fetchone() is not None
+    
+    def _migrate(self, cursor):
+        """Upgrade data written by older versions, tracked via PRAGMA user_version."""
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        
+        if version < 1:
+            # Embeddings used to be stored as float64 although they are read back as float32
+            rows = cursor.execute("SELECT id, embedding FROM embeddings").fetchall()
+            cursor.executemany(
+                "UPDATE embeddings SET embedding = ? WHERE id = ?",
+                [(np.frombuffer(blob, dtype=np.float64).astype(np.float32).tobytes(), emb_id) for emb_id, blob in rows]
+            )
+            cursor.execute("PRAGMA user_version = 1")
+        
+        if version < 3:
+            # Embeddings are stored unit-normalized and int8-quantized with a per-vector scale.
+            # Version 2 stored them int8-quantized with a fixed scale of 1/127, older ones as float32.
+            if version < 2:
+                decode = lambda blob: np.frombuffer(blob, dtype=np.float32)
+            else:
+                decode = lambda blob: np.frombuffer(blob, dtype=np.int8).astype(np.float32) / 127
+            
+            cursor.execute("ALTER TABLE embeddings ADD COLUMN scale REAL")
+            rows = cursor.execute("SELECT id, embedding FROM embeddings").fetchall()
+            cursor.executemany(
+                "UPDATE embeddings SET embedding = ?, scale = ? WHERE id = ?",
+                [(*_quantize(decode(blob)), emb_id) for emb_id, blob in rows]
+            )
+            cursor.execute("PRAGMA user_version = 3")
+        
+        if version < 4:
+            # Documents are embedded per chunk; existing rows hold a single whole-document chunk
+            cursor.execute("ALTER TABLE embeddings ADD COLUMN chunk_index INTEGER DEFAULT 0")
+            cursor.execute("ALTER TABLE embeddings ADD COLUMN chunk_text TEXT")
+            cursor.execute("PRAGMA user_version = 4")
+        
+        if version < 5:
+            # Content hashes for exact (unique) and near-duplicate detection; rows that
+            # already duplicate an earlier document keep a NULL content_sha
+            cursor.execute("ALTER TABLE documents ADD COLUMN content_sha TEXT")
+            cursor.execute("ALTER TABLE documents ADD COLUMN simhash INTEGER")
+            seen = set()
+            updates = []
+            for doc_id, content in cursor.execute("SELECT id, content FROM documents ORDER BY created_at").fetchall():
+                sha = hashlib.sha256(content.encode()).hexdigest()
+                updates.append((None if sha in seen else sha, _simhash(content), doc_id))
+                seen.add(sha)
+            cursor.executemany("UPDATE documents SET content_sha = ?, simhash = ? WHERE id = ?", updates)
+            cursor.execute("CREATE UNIQUE INDEX idx_docs_content_sha ON documents(content_sha)")
+            cursor.execute("PRAGMA user_version = 5")
+    
+    def _load_index(self):
+        """Load the FAISS index from disk, rebuilding it if it is missing or out of date."""
+        if faiss is None:
+            return
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            count = cursor.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            version = self._get_meta(cursor, "embeddings_version") or 0
+            saved_version = self._get_meta(cursor, "faiss_version")
+        
+        # Rowids are reused after deletes, so a matching count alone doesn't prove the file is current
+        if os.path.exists(self.index_path) and saved_version == version:
+            index = faiss.read_index(self.index_path)
+            if index.ntotal == count:
+                self._index = index
+                self._index_version = version
+                return
+        
+        with self._connect() as conn:
+            rows = conn.execute("SELECT rowid, embedding, scale FROM embeddings").fetchall()
+        if rows:
+            self._index_add([row[0] for row in rows], [_dequantize(row[1], row[2]) for row in rows], version)
+    
+    def _get_meta(self, cursor, key):
+        row = cursor.execute("SELECT value FROM kb_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def _set_meta(self, cursor, key, value):
+        cursor.execute(
+            "INSERT INTO kb_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+    
+    def _bump_embeddings_version(self, cursor):
+        """Advance embeddings_version within the caller's transaction and return the new value."""
+        version = (self._get_meta(cursor, "embeddings_version") or 0) + 1
+        self._set_meta(cursor, "embeddings_version", version)
+        return version
+    
+    def _index_add(self, rowids, embeddings, version):
+        """Add embeddings to the FAISS index, normalized so inner product is cosine similarity.
+
+        version is the embeddings_version the index reflects afterwards.
+        """
+        if faiss is None:
+            return
+        
+        vectors = np.array(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        with self._index_lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            self._index.add_with_ids(vectors, np.asarray(rowids, dtype=np.int64))
+            self._index_dirty = True
+            self._index_version = max(self._index_version, version)
+    
+    def _load_vec(self):
+        """Copy embeddings missing from the sqlite-vec table into it."""
+        if not self._vec:
+            return
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            has_table = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'vec_embeddings'"
+            ).fetchone()
+            query = "SELECT rowid, embedding, scale FROM embeddings"
+            if has_table:
+                query += " WHERE rowid NOT IN (SELECT rowid FROM vec_embeddings)"
+            rows = cursor.execute(query).fetchall()
+            if rows:
+                self._vec_insert(cursor, [row[0] for row in rows], [_dequantize(row[1], row[2]) for row in rows])
+                conn.commit()
+    
+    def _vec_insert(self, cursor, rowids, embeddings):
+        """Add embeddings to the sqlite-vec table, keyed by embeddings.rowid."""
+        if not self._vec or not rowids:
+            return
+        
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS vec_embeddings USING vec0(embedding float[{len(embeddings[0])}] distance_metric=cosine)"
+        )
+        cursor.executemany(
+            "INSERT INTO vec_embeddings (rowid, embedding) VALUES (?, ?)",
+            [(rowid, np.asarray(embedding, dtype=np.float32).tobytes()) for rowid, embedding in zip(rowids, embeddings)]
+        )
+    
+    def _matrix_add(self, rowids, blobs, scales):
+        # Keep an already-loaded matrix current; an unloaded one picks the rows up when built
+        with self._index_lock:
+            if self._emb_rowids is None or not rowids:
+                return
+            rows = np.frombuffer(b"".join(blobs), dtype=np.int8).reshape(len(blobs), -1)
+            self._emb_matrix = rows if self._emb_matrix is None else np.vstack([self._emb_matrix, rows])
+            self._emb_scales = np.concatenate([self._emb_scales, np.asarray(scales, dtype=np.float32)])
+            self._emb_rowids = np.concatenate([self._emb_rowids, np.asarray(rowids, dtype=np.int64)])
+    
+    def _matrix_remove(self, rowids):
+        with self._index_lock:
+            if self._emb_rowids is None or not rowids:
+                return
+            keep = ~np.isin(self._emb_rowids, rowids)
+            self._emb_rowids = self._emb_rowids[keep]
+            self._emb_scales = self._emb_scales[keep]
+            self._emb_matrix = self._emb_matrix[keep] if keep.any() else None
+    
+    def _index_remove(self, rowids, version):
+        if self._index is None or not rowids:
+            return
+        
+        with self._index_lock:
+            self._index.remove_ids(np.asarray(rowids, dtype=np.int64))
+            self._index_dirty = True
+            self._index_version = max(self._index_version, version)
+    
+    def close(self):
+        """Persist the FAISS index if it changed since it was loaded and close the database."""
+        with self._index_lock:
+            if self._index is not None and self._index_dirty:
+                faiss.write_index(self._index, self.index_path)
+                self._index_dirty = False
+                with self._connect() as conn:
+                    self._set_meta(conn.cursor(), "faiss_version", self._index_version)
+        
+        with self._db_lock:
+            self.conn.close()
+    
     def _get_embedding(self, text):
         """Generate embedding vector for the given text using OpenAI API."""
         # Clean and truncate text if needed (OpenAI has token limits)
         clean_text = text.strip().replace("\n", " ")
         
+        # Repeated queries are served from the cache without an API call
+        key = hashlib.sha256(clean_text.encode()).hexdigest()
+        with self._embedding_cache_lock:
+            if key in self._embedding_cache:
+                self._embedding_cache.move_to_end(key)
+                return self._embedding_cache[key]
+        
         # Get embedding from OpenAI
         response = self.client.embeddings.create(
             input=clean_text,
@@ -84,48 +528,214 @@ class KnowledgeBase:
         # Extract embedding from response
         embedding = response.data[0].embedding
         
+        with self._embedding_cache_lock:
+            self._embedding_cache[key] = embedding
+            if len(self._embedding_cache) > self._embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+        
         return embedding
     
+    def _get_embeddings(self, texts, batch_size=100):
+        """Generate embeddings for several texts, batch_size texts per API request."""
+        if len(texts) <= batch_size:
+            response = self.client.embeddings.create(
+                input=[text.strip().replace("\n", " ") for text in texts],
+                model=self.embedding_model
+            )
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        
+        # Larger ingests send their batches concurrently on a short-lived event loop
+        return asyncio.run(self._aembed_detached(texts, batch_size))
+    
+    async def _aembed_detached(self, texts, batch_size):
+        # An async client is bound to the loop it is used on, so each asyncio.run opens and closes its own
+        async with AsyncOpenAI(api_key=self.api_key) as client:
+            return await self.aembed_many(texts, client, batch_size)
+    
+    async def aembed_many(self, texts, client, batch_size=100, concurrency=16):
+        """Embed texts through the AsyncOpenAI client with up to concurrency batch requests in flight at once."""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        # Batch texts of similar length together; results are put back in input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+        
+        async def embed_batch(batch):
+            async with semaphore:
+                response = await client.embeddings.create(
+                    input=[texts[i].strip().replace("\n", " ") for i in batch],
+                    model=self.embedding_model
+                )
+            # Results carry their position within the request
+            return [(batch[item.index], item.embedding) for item in response.data]
+        
+        embeddings = [None] * len(texts)
+        for results in await asyncio.gather(*(embed_batch(batch) for batch in batches)):
+            for i, embedding in results:
+                embeddings[i] = embedding
+        
+        return embeddings
+    
+    def embed_query(self, query):
+        """Embed a query as a unit-length float32 vector."""
+        embedding = np.asarray(self._get_embedding(query), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+    
     def add_document(self, content, title=None, source=None, metadata=None):
         """Add a document to the knowledge base with its embedding."""
-        # Generate a unique ID
-        doc_id = str(uuid.uuid4())
-        
-        # Generate title if not provided
-        if not title:
-            title = content[:50] + ("..." if len(content) > 50 else "")
+        return self.add_documents([{
+            "content": content,
+            "title": title,
+            "source": source,
+            "metadata": metadata
+        }])[0]
+    
+    def add_documents(self, documents):
+        """Add several documents using batched embedding requests and one transaction.
+
+        Each item is a dict with 'content' and optional 'title', 'source' and
+        'metadata' keys. Long content is embedded as overlapping chunks, one
+        embeddings row each. Content already in the knowledge base is not added
+        again (its existing ID is returned), and near-duplicates of a stored
+        document reuse the embeddings of the chunks they share with it. Returns the
+        document IDs in input order.
+        """
+        if not documents:
+            return []
         
-        # Current timestamp
         timestamp = datetime.now().isoformat()
         
-        # Store the document
-        with sqlite3.connect(self.db_path) as conn:
+        doc_ids = []
+        document_rows = []
+        batch_ids = {}
+        for document in documents:
+            content = document['content']
+            sha = hashlib.sha256(content.encode()).hexdigest()
+            if sha in batch_ids:
+                # Repeated within this batch
+                doc_ids.append(batch_ids[sha])
+                continue
+            
+            title = document.get('title') or content[:50] + ("..." if len(content) > 50 else "")
+            batch_ids[sha] = str(uuid.uuid4())
+            doc_ids.append(batch_ids[sha])
+            document_rows.append((
+                batch_ids[sha], title, content, document.get('source'),
+                _dumps(document.get('metadata') or {}), timestamp, timestamp, sha, _simhash(content)
+            ))
+        
+        # Look up exact and near duplicates already stored
+        existing = {}
+        similar = {}
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            for row in document_rows:
+                match = cursor.execute("SELECT id FROM documents WHERE content_sha = ?", (row[7],)).fetchone()
+                if match:
+                    existing[row[0]] = match[0]
+                    cursor.execute(
+                        "UPDATE documents SET accessed_at = ?, access_count = access_count + 1 WHERE id = ?",
+                        (timestamp, match[0])
+                    )
+                    continue
+                
+                match = cursor.execute(
+                    "SELECT id FROM documents WHERE HAMMING(simhash, ?) < 3 LIMIT 1", (row[8],)
+                ).fetchone()
+                if match:
+                    similar[row[0]] = match[0]
+        
+        document_rows = [row for row in document_rows if row[0] not in existing]
+        
+        # Near-duplicates reuse the stored vectors of the chunks they share with the document they resemble
+        reusable = {}
+        if similar:
+            with self._connect() as conn:
+                reusable = self._chunk_vectors(conn.cursor(), similar.values())
+        
+        # One embeddings row per chunk; single-chunk documents don't repeat their content in chunk_text
+        chunk_rows = []
+        for row in document_rows:
+            chunks = _chunk_text(row[2])
+            for index, chunk in enumerate(chunks):
+                chunk_rows.append((row[0], index, chunk if len(chunks) > 1 else None, chunk))
+        
+        to_embed = list(dict.fromkeys(chunk for *_, chunk in chunk_rows if chunk not in reusable))
+        vectors = dict(zip(to_embed, self._get_embeddings(to_embed))) if to_embed else {}
+        
+        with self._connect() as conn:
             cursor = conn.cursor()
             
-            # Insert document
-            cursor.execute(
-                "INSERT INTO documents (id, title, content, source, metadata, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (doc_id, title, content, source, json.dumps(metadata or {}), timestamp, timestamp)
-            )
+            # Another writer may have stored the same content since the lookup above
+            for row in document_rows:
+                cursor.execute(
+                    "INSERT INTO documents (id, title, content, source, metadata, created_at, accessed_at, content_sha, simhash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(content_sha) DO NOTHING",
+                    row
+                )
+                if cursor.rowcount == 0:
+                    existing[row[0]] = cursor.execute(
+                        "SELECT id FROM documents WHERE content_sha = ?", (row[7],)
+                    ).fetchone()[0]
+            chunk_rows = [chunk_row for chunk_row in chunk_rows if chunk_row[0] not in existing]
             
-            # Generate and store embedding
-            embedding = self._get_embedding(content)
-            embedding_bytes = np.array(embedding).tobytes()
+            # The resembled documents may have been deleted since; embed whatever can no longer be reused
+            if similar:
+                reusable = self._chunk_vectors(cursor, similar.values())
+            missing = list(dict.fromkeys(
+                chunk for *_, chunk in chunk_rows if chunk not in vectors and chunk not in reusable
+            ))
+            if missing:
+                vectors.update(zip(missing, self._get_embeddings(missing)))
             
-            cursor.execute(
-                "INSERT INTO embeddings (id, document_id, embedding, created_at) VALUES (?, ?, ?, ?)",
-                (str(uuid.uuid4()), doc_id, embedding_bytes, timestamp)
-            )
+            # Insert one at a time (still in the same transaction) to collect rowids for the index
+            rowids = []
+            embeddings = []
+            blobs = []
+            scales = []
+            for doc_id, chunk_index, chunk_text, chunk in chunk_rows:
+                if chunk in vectors:
+                    embedding = vectors[chunk]
+                    blob, scale = _quantize(embedding)
+                else:
+                    blob, scale = reusable[chunk]
+                    embedding = _dequantize(blob, scale)
+                cursor.execute(
+                    "INSERT INTO embeddings (id, document_id, chunk_index, chunk_text, embedding, scale, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(uuid.uuid4()), doc_id, chunk_index, chunk_text, blob, scale, timestamp)
+                )
+                rowids.append(cursor.lastrowid)
+                embeddings.append(embedding)
+                blobs.append(blob)
+                scales.append(scale)
+            
+            self._vec_insert(cursor, rowids, embeddings)
+            version = self._bump_embeddings_version(cursor) if rowids else None
             
             conn.commit()
         
-        return doc_id
+        if rowids:
+            self._index_add(rowids, embeddings, version)
+            self._matrix_add(rowids, blobs, scales)
+        
+        return [existing.get(doc_id, doc_id) for doc_id in doc_ids]
+    
+    def _chunk_vectors(self, cursor, doc_ids):
+        """Stored {chunk text: (embedding blob, scale)} of the given documents."""
+        doc_ids = list(set(doc_ids))
+        placeholders = ",".join("?" * len(doc_ids))
+        rows = cursor.execute(f'''
+            SELECT COALESCE(e.chunk_text, d.content), e.embedding, e.scale
+            FROM embeddings e
+            JOIN documents d ON d.id = e.document_id
+            WHERE e.document_id IN ({placeholders})
+        ''', doc_ids).fetchall()
+        return {text: (blob, scale) for text, blob, scale in rows}
     
     def retrieve_document(self, doc_id):
         """Retrieve a document by its ID."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             # Update access stats
             timestamp = datetime.now().isoformat()
@@ -135,67 +745,157 @@ class KnowledgeBase:
             )
             
             # Retrieve document
-            cursor.execute("SELECT * FROM documents WHERE id = ?", (doc_id,))
-            result = cursor.row_factory(cursor, cursor.fetchone())
+            cursor.execute(f"SELECT {_DOC_COLUMNS} FROM documents WHERE id = ?", (doc_id,))
+            result = cursor.fetchone()
             
             if result:
                 # Convert to dictionary
                 doc = dict(result)
-                doc['metadata'] = json.loads(doc['metadata'])
+                doc['metadata'] = _loads(doc['metadata'])
                 return doc
             
             return None
     
-    def retrieve_similar(self, query, limit=5):
-        """Retrieve documents similar to the query."""
+    def retrieve_similar(self, query, limit=5, query_embedding=None):
+        """Retrieve documents similar to the query.
+
+        A precomputed query_embedding (e.g. from embed_query) skips the embedding call.
+        """
         # Generate embedding for the query
-        query_embedding = self._get_embedding(query)
-        query_embedding_array = np.array(query_embedding)
+        if query_embedding is None:
+            query_embedding = self._get_embedding(query)
+        
+        # Several chunks of one document may score highly, so over-fetch before deduplicating
+        candidates = limit * 4
+        if self._index is not None:
+            similarities = self._search_index(query_embedding, candidates)
+        elif self._vec:
+            similarities = self._search_vec(query_embedding, candidates)
+        else:
+            similarities = self._search_matrix(query_embedding, candidates)
+        
+        return self._fetch_scored_documents(similarities)[:limit]
+    
+    def _search_index(self, query_embedding, limit):
+        """Top-limit cosine search through the FAISS index, as {embedding rowid: similarity}."""
+        query_vector = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(query_vector)
+        
+        with self._index_lock:
+            if not self._index.ntotal:
+                return {}
+            scores, rowids = self._index.search(query_vector, min(limit, self._index.ntotal))
+        
+        return {int(rowid): float(score) for rowid, score in zip(rowids[0], scores[0]) if rowid != -1}
+    
+    def _search_vec(self, query_embedding, limit):
+        """Top-limit cosine search through the sqlite-vec table, as {embedding rowid: similarity}."""
+        with self._connect() as conn:
+            try:
+                rows = conn.execute(
+                    "SELECT rowid, distance FROM vec_embeddings WHERE embedding MATCH ? AND k = ?",
+                    (np.asarray(query_embedding, dtype=np.float32).tobytes(), limit)
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # The table is created with the first stored embedding
+                return {}
+        
+        return {rowid: 1.0 - distance for rowid, distance in rows}
+    
+    def _search_matrix(self, query_embedding, limit):
+        """Top-limit cosine search over the cached int8 matrix, as {embedding rowid: similarity}."""
+        with self._index_lock:
+            if self._emb_rowids is None:
+                with self._connect() as conn:
+                    rows = conn.execute("SELECT rowid, embedding, scale FROM embeddings").fetchall()
+                self._emb_rowids = np.array([row[0] for row in rows], dtype=np.int64)
+                self._emb_scales = np.array([row[2] for row in rows], dtype=np.float32)
+                self._emb_matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.int8).reshape(len(rows), -1) if rows else None
+            matrix, scales, rowids = self._emb_matrix, self._emb_scales, self._emb_rowids
+        
+        if matrix is None:
+            return {}
+        
+        # Integer dot product against the quantized query, rescaled to cosine similarity
+        query_blob, query_scale = _quantize(query_embedding)
+        query_i8 = np.frombuffer(query_blob, dtype=np.int8)
+        if _int8_scores is not None:
+            scores = _int8_scores(matrix, query_i8, scales, np.float32(query_scale))
+        else:
+            # Upcast a block of rows at a time so the product runs through float32 BLAS
+            query_f32 = query_i8.astype(np.float32)
+            scores = np.empty(len(matrix), dtype=np.float32)
+            for start in range(0, len(matrix), _SCORE_BLOCK_ROWS):
+                block = slice(start, start + _SCORE_BLOCK_ROWS)
+                scores[block] = matrix[block].astype(np.float32) @ query_f32
+            scores *= scales * np.float32(query_scale)
         
-        # Retrieve all documents and their embeddings
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return {int(rowids[i]): float(scores[i]) for i in top}
+    
+    def _fetch_scored_documents(self, similarities):
+        """Load the documents behind {embedding rowid: similarity}, best match first.
+
+        Each document appears once, scored by its best chunk, which is returned as 'chunk'.
+        """
+        if not similarities:
+            return []
+        
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
-            cursor.execute('''
-                SELECT d.id, d.title, d.content, d.source, d.metadata, e.embedding
-                FROM documents d
-                JOIN embeddings e ON d.id = e.document_id
-            ''')
+            placeholders = ",".join("?" * len(similarities))
+            cursor.execute(f'''
+                SELECT e.rowid AS embedding_rowid, COALESCE(e.chunk_text, d.content) AS chunk,
+                       d.id, d.title, d.content, d.source, d.metadata
+                FROM embeddings e
+                JOIN documents d ON d.id = e.document_id
+                WHERE e.rowid IN ({placeholders})
+            ''', list(similarities))
             
-            results = []
+            results = {}
             for row in cursor.fetchall():
+                similarity = similarities[row['embedding_rowid']]
+                if row['id'] in results and results[row['id']]['similarity'] >= similarity:
+                    continue
                 doc = dict(row)
-                embedding_bytes = doc.pop('embedding')
-                doc_embedding = np.frombuffer(embedding_bytes, dtype=np.float32)
-                
-                # Calculate cosine similarity
-                similarity = np.dot(query_embedding_array, doc_embedding) / (
-                    np.linalg.norm(query_embedding_array) * np.linalg.norm(doc_embedding)
-                )
-                
-                doc['similarity'] = float(similarity)
-                doc['metadata'] = json.loads(doc['metadata'])
-                results.append(doc)
-            
-            # Sort by similarity and take top 'limit'
-            results.sort(key=lambda x: x['similarity'], reverse=True)
-            return results[:limit]
+                del doc['embedding_rowid']
+                doc['similarity'] = similarity
+                doc['metadata'] = _loads(doc['metadata'])
+                results[doc['id']] = doc
+        
+        return sorted(results.values(), key=lambda x: x['similarity'], reverse=True)
     
     def delete_document(self, doc_id):
         """Delete a document and its embedding."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
+            embedding_rowids = [row[0] for row in cursor.execute(
+                "SELECT rowid FROM embeddings WHERE document_id = ?", (doc_id,)
+            )]
+            
             # Delete embedding first due to foreign key constraint
             cursor.execute("DELETE FROM embeddings WHERE document_id = ?", (doc_id,))
+            if self._vec and embedding_rowids:
+                cursor.execute(
+                    f"DELETE FROM vec_embeddings WHERE rowid IN ({','.join('?' * len(embedding_rowids))})",
+                    embedding_rowids
+                )
             
             # Delete document
             cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            deleted = cursor.rowcount > 0
+            version = self._bump_embeddings_version(cursor) if embedding_rowids else None
             
             conn.commit()
-            
-            return cursor.rowcount > 0
+        
+        self._index_remove(embedding_rowids, version)
+        self._matrix_remove(embedding_rowids)
+        
+        return deleted
     
     def log_conversation(self, user_query, assistant_response, context_ids=None):
         """Log a conversation with the context documents used."""
@@ -203,9 +903,9 @@ class KnowledgeBase:
         timestamp = datetime.now().isoformat()
         
         # Convert context_ids to JSON string if provided
-        context_ids_str = json.dumps(context_ids) if context_ids else "[]"
+        context_ids_str = _dumps(context_ids) if context_ids else "[]"
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute(
@@ -219,70 +919,86 @@ class KnowledgeBase:
     
     def search_documents(self, query, field="content", limit=10):
         """Search documents using simple text search."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
-            # Simple keyword search
-            search_query = f"%{query}%"
-            cursor.execute(
-                f"SELECT * FROM documents WHERE {field} LIKE ? ORDER BY created_at DESC LIMIT ?",
-                (search_query, limit)
-            )
+            if self._fts and field in ("title", "content") and len(query) >= 3:
+                # Trigram index lookup; a quoted phrase matches the same substrings as LIKE
+                phrase = '"' + query.replace('"', '""') + '"'
+                cursor.execute(
+                    f"SELECT {_DOC_COLUMNS} FROM documents WHERE rowid IN "
+                    f"(SELECT rowid FROM docs_fts WHERE docs_fts MATCH ?) ORDER BY created_at DESC LIMIT ?",
+                    (f"{field} : {phrase}", limit)
+                )
+            else:
+                # Simple keyword search (trigrams need at least three characters)
+                search_query = f"%{query}%"
+                cursor.execute(
+                    f"SELECT {_DOC_COLUMNS} FROM documents WHERE {field} LIKE ? ORDER BY created_at DESC LIMIT ?",
+                    (search_query, limit)
+                )
             
             results = []
             for row in cursor.fetchall():
                 doc = dict(row)
-                doc['metadata'] = json.loads(doc['metadata'])
+                doc['metadata'] = _loads(doc['metadata'])
                 results.append(doc)
             
             return results
     
     def get_document_count(self):
         """Get the total number of documents in the knowledge base."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM documents")
             return cursor.fetchone()[0]
             
     def get_recent_documents(self, limit=10):
         """Get the most recently added documents."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             cursor.execute(
-                "SELECT * FROM documents ORDER BY created_at DESC LIMIT ?",
+                f"SELECT {_DOC_COLUMNS} FROM documents ORDER BY created_at DESC LIMIT ?",
                 (limit,)
             )
             
             results = []
             for row in cursor.fetchall():
                 doc = dict(row)
-                doc['metadata'] = json.loads(doc['metadata'])
+                doc['metadata'] = _loads(doc['metadata'])
                 results.append(doc)
             
             return results
     
-    def get_rag_context(self, query, max_tokens=1500):
+    def get_rag_context(self, query, max_tokens=1500, query_embedding=None):
         """Get RAG context for a query, formatted for insertion into a prompt."""
-        similar_docs = self.retrieve_similar(query)
+        similar_docs = self.retrieve_similar(query, query_embedding=query_embedding)
         
         context = "Knowledge Base Context:\n"
         total_length = 0
         used_docs = []
         
         for doc in similar_docs:
-            doc_content = doc['content']
-            # Approximate token count (1 token ≈ 4 characters)
-            doc_tokens = len(doc_content) / 4
+            # The best matching chunk rather than the whole document
+            doc_content = doc['chunk']
+            if _encoding() is not None:
+                token_ids = _token_ids(doc_content)
+                doc_tokens = len(token_ids)
+            else:
+                # Approximate token count (1 token ≈ 4 characters)
+                doc_tokens = len(doc_content) / 4
             
             if total_length + doc_tokens > max_tokens:
-                # Truncate if needed
-                available_tokens = max_tokens - total_length
-                available_chars = int(available_tokens * 4)
-                if available_chars > 100:  # Only add if we can include meaningful content
-                    doc_content = doc_content[:available_chars] + "..."
+                # Truncate if needed, on a token boundary when the tokenizer is available
+                available_tokens = int(max_tokens - total_length)
+                if available_tokens > 25:  # Only add if we can include meaningful content
+                    if _encoding() is not None:
+                        doc_content = _encoding().decode(token_ids[:available_tokens]) + "..."
+                    else:
+                        doc_content = doc_content[:available_tokens * 4] + "..."
                     context += f"\n--- Document: {doc['title']} ---\n{doc_content}\n"
                     used_docs.append(doc['id'])
                 break
@@ -7,6 +7,10 @@ import json
 from datetime import datetime
 import re
 import argparse
+from knowledge_base import _dumps, _loads
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
 
 def run_powershell_command(command):
     completed = subprocess.run(["powershell", "-Command", command], capture_output=True, text=True)
@@ -45,24 +49,34 @@ def filter_headers(headers):
 def filter_content(content):
     if content is None:
         return None
-    content = re.sub(r'<[^>]+>', '', content)
-    content = re.sub(r'\s+', ' ', content).strip()
+    content = _TAG_RE.sub('', content)
+    content = _WS_RE.sub(' ', content).strip()
     return content[:1000] + ('...' if len(content) > 1000 else '')
 
 def extract_cookies(headers):
     cookies = headers.get_all('Set-Cookie')
     return [cookie.split(';')[0] for cookie in cookies]
 
+def jsonl_to_json(jsonl_file, json_file):
+    """Convert a JSON Lines log into the older single JSON array format."""
+    with open(jsonl_file, 'r') as f:
+        logs = [_loads(line) for line in f if line.strip()]
+    with open(json_file, 'w') as f:
+        json.dump(logs, f, indent=2)
+
 class HTTPLogger:
+    # Buffered entries are flushed to disk after this many responses
+    FLUSH_EVERY = 50
+
     def __init__(self, url_filter=None, domain_filter=None):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.log_file = os.path.join(os.getcwd(), f"http_log_{timestamp}.json")
+        self.log_file = os.path.join(os.getcwd(), f"http_log_{timestamp}.jsonl")
         self.url_filter = url_filter.lower() if url_filter else None
         self.domain_filter = domain_filter.lower() if domain_filter else None
         
-        # Initialize the log file with an empty array
-        with open(self.log_file, 'w') as f:
-            f.write('[]')
+        # One JSON object per line, appended through a buffered handle kept open for the session
+        self.fh = open(self.log_file, 'a', buffering=1 << 16)
+        self.pending = 0
             
         # Enable proxy (platform-specific)
         set_proxy(True)
@@ -97,25 +111,22 @@ class HTTPLogger:
             
             # Only log if there's content to log
             if log_entry["request_content"] or log_entry["response_content"]:
-                # Read the existing log entries
-                with open(self.log_file, 'r') as f:
-                    try:
-                        logs = json.load(f)
-                    except json.JSONDecodeError:
-                        logs = []
-                
-                # Append the new entry
-                logs.append(log_entry)
-                
-                # Write back the updated logs
-                with open(self.log_file, 'w') as f:
-                    json.dump(logs, f, indent=2)
+                self.fh.write(_dumps(log_entry) + "\n")
+                self.pending += 1
+                if self.pending >= self.FLUSH_EVERY:
+                    self.fh.flush()
+                    self.pending = 0
                 
                 print(f"Logged: {flow.request.method} {flow.request.url}")
         except Exception as e:
             print(f"Error logging request: {str(e)}")
 
     def done(self):
+        # Write out buffered entries and a JSON array copy for tools expecting the old format
+        if not self.fh.closed:
+            self.fh.close()
+            jsonl_to_json(self.log_file, os.path.splitext(self.log_file)[0] + ".json")
+        
         # Disable proxy when done
         set_proxy(False)
 
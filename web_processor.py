@@ -1,4 +1,10 @@
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
+import os
+import threading
+import multiprocessing
+import concurrent.futures
 from bs4 import BeautifulSoup
 import json
 import re
@@ -6,6 +12,39 @@ from urllib.parse import urlparse
 import logging
 from datetime import datetime
 
+# aiohttp is optional; without it bulk fetches run the pooled session on worker threads
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# lxml is optional; it parses HTML several times faster than the pure-Python html.parser
+try:
+    import lxml
+    _PARSER = 'lxml'
+except ImportError:
+    _PARSER = 'html.parser'
+
+# Content types worth decoding and parsing as a page
+_TEXT_TYPE = re.compile(r'^text/|html|xml')
+
+def _is_text_page(content_type):
+    """Whether a Content-Type header (None if absent) is worth decoding as a page."""
+    return not content_type or _TEXT_TYPE.search(content_type.split(";")[0].strip().lower()) is not None
+
+# Class names that usually mark the main content container
+_MAIN_CLS = re.compile(r'content|main|post|article')
+
+# Per-process WebProcessor used by _parse_page in parser worker processes
+_worker_processor = None
+
+def _parse_page(html_content, url):
+    """Module-level (picklable) entry point for parsing a page in a worker process."""
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = WebProcessor()
+    return _worker_processor.process_html(html_content, url)
+
 class WebProcessor:
     def __init__(self, user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/97.0.4692.71 Safari/537.36"):
         """Initialize WebProcessor with a default user agent."""
@@ -14,6 +53,18 @@ class WebProcessor:
             "User-Agent": user_agent
         }
         
+        # Pooled session so repeated fetches to a host reuse TCP/TLS connections
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # Worker processes for HTML parsing (CPU-bound), created on first bulk use
+        self._parse_pool = None
+        self._parse_workers = 0
+        self._parse_pool_lock = threading.Lock()
+        
         # Set up logging
         self.logger = logging.getLogger('WebProcessor')
         self.logger.setLevel(logging.INFO)
@@ -26,19 +77,65 @@ class WebProcessor:
     def fetch_url(self, url, timeout=10):
         """Fetch content from a URL."""
         try:
-            response = requests.get(url, headers=self.headers, timeout=timeout)
+            response = self.session.get(url, timeout=timeout)
             response.raise_for_status()
+            # Skip PDFs, images and other binary content rather than decoding them
+            if not _is_text_page(response.headers.get("Content-Type")):
+                self.logger.info(f"Skipping {url}: {response.headers['Content-Type']} is not a text page")
+                return None
             return response.text
         except requests.RequestException as e:
             self.logger.error(f"Error fetching {url}: {str(e)}")
             return None
     
+    async def afetch_urls(self, urls, timeout=10, concurrency=16):
+        """Fetch several URLs concurrently; returns content (or None on failure) in input order."""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        if aiohttp is None:
+            async def fetch(url):
+                async with semaphore:
+                    return await asyncio.to_thread(self.fetch_url, url, timeout)
+            return await asyncio.gather(*(fetch(url) for url in urls))
+        
+        async def fetch(session, url):
+            async with semaphore:
+                try:
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        # Skip PDFs, images and other binary content rather than decoding them
+                        if not _is_text_page(response.headers.get("Content-Type")):
+                            self.logger.info(f"Skipping {url}: {response.content_type} is not a text page")
+                            return None
+                        return await response.text(errors="replace")
+                except Exception as e:
+                    # One bad link must not fail the whole gather
+                    self.logger.error(f"Error fetching {url}: {str(e)}")
+                    return None
+        
+        async with aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=32),
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as session:
+            return await asyncio.gather(*(fetch(session, url) for url in urls))
+    
+    def _parse(self, html_content):
+        """Parse HTML once so the extract helpers can share the tree."""
+        return BeautifulSoup(html_content, _PARSER)
+    
+    def _clean_text(self, text):
+        """Strip each line, split on double spaces and drop empty pieces."""
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return '\n'.join(chunk for chunk in chunks if chunk)
+    
     def extract_text_from_html(self, html_content):
         """Extract clean text from HTML content."""
         if not html_content:
             return None
             
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = self._parse(html_content)
         
         # Remove script and style elements
         for script in soup(["script", "style", "footer", "nav", "aside"]):
@@ -47,26 +144,19 @@ class WebProcessor:
         # Get text and clean it
         text = soup.get_text(separator=' ')
         
-        # Clean the text
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        return text
+        return self._clean_text(text)
     
-    def extract_main_content(self, html_content, url):
-        """Extract the main content from an HTML page."""
-        if not html_content:
+    def extract_main_content(self, soup, url):
+        """Extract the main content from a parsed HTML page (removes boilerplate tags from soup)."""
+        if soup is None:
             return None
-            
-        soup = BeautifulSoup(html_content, 'html.parser')
         
         # Remove navigation, header, footer, etc.
         for tag in soup.find_all(['nav', 'header', 'footer', 'aside', 'script', 'style', 'noscript']):
             tag.decompose()
         
         # Try to find the main content
-        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_=re.compile(r'content|main|post|article'))
+        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_=_MAIN_CLS)
         
         if main_content:
             text = main_content.get_text(separator=' ')
@@ -74,16 +164,11 @@ class WebProcessor:
             # Fallback to the body if no main content is found
             text = soup.body.get_text(separator=' ') if soup.body else soup.get_text(separator=' ')
         
-        # Clean the text
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        return text
+        return self._clean_text(text)
     
-    def extract_metadata(self, html_content, url):
-        """Extract metadata from HTML content."""
-        if not html_content:
+    def extract_metadata(self, soup, url):
+        """Extract metadata from a parsed HTML page."""
+        if soup is None:
             return {}
             
         metadata = {
@@ -92,8 +177,6 @@ class WebProcessor:
             "fetched_at": datetime.now().isoformat()
         }
         
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
         # Extract title
         title_tag = soup.find('title')
         if title_tag:
@@ -126,28 +209,82 @@ class WebProcessor:
         if not html_content:
             return None
         
-        # Extract content
-        main_content = self.extract_main_content(html_content, url)
+        return self.process_html(html_content, url)
+    
+    async def aprocess_urls(self, urls):
+        """Fetch and process several URLs concurrently; returns results (or None) in input order.
+
+        Fetches run on the event loop; parsing is spread over worker processes.
+        """
+        pages = await self.afetch_urls(urls)
+        
+        # Crawl waves are small, so size the pool to the wave rather than the machine.
+        # Workers are spawned, not forked: this process runs the event loop and tool threads.
+        workers = min(os.cpu_count() or 1, sum(1 for html_content in pages if html_content))
+        if not workers:
+            return [None] * len(urls)
+        with self._parse_pool_lock:
+            if workers > self._parse_workers:
+                if self._parse_pool is not None:
+                    self._parse_pool.shutdown(wait=False)
+                self._parse_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._parse_workers = workers
+            pool = self._parse_pool
+        
+        loop = asyncio.get_running_loop()
+        
+        async def parse(html_content, url):
+            if not html_content:
+                return None
+            try:
+                return await loop.run_in_executor(pool, _parse_page, html_content, url)
+            except Exception as e:
+                self.logger.error(f"Error processing {url}: {str(e)}")
+                return None
+        
+        return await asyncio.gather(*(parse(html_content, url) for html_content, url in zip(pages, urls)))
+    
+    def close(self):
+        """Shut down the parser processes and the pooled session."""
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+            self._parse_pool = None
+            self._parse_workers = 0
+        self.session.close()
+    
+    def process_html(self, html_content, url, include_links=False):
+        """Extract content, metadata and optionally links from already fetched HTML."""
+        soup = self._parse(html_content)
         
-        # Extract metadata
-        metadata = self.extract_metadata(html_content, url)
+        # Extract metadata and links before the content pass strips nav/header/footer
+        metadata = self.extract_metadata(soup, url)
+        links = self.extract_links(soup, url) if include_links else None
+        
+        # Extract content
+        main_content = self.extract_main_content(soup, url)
         
         # Determine title
         title = metadata.get("title") or metadata.get("og_title") or url
         
-        return {
+        result = {
             "title": title,
             "content": main_content,
             "source": url,
             "metadata": metadata
         }
+        
+        if include_links:
+            result["links"] = links
+        
+        return result
     
-    def extract_links(self, html_content, base_url):
-        """Extract links from HTML content."""
-        if not html_content:
+    def extract_links(self, soup, base_url):
+        """Extract links from a parsed HTML page."""
+        if soup is None:
             return []
-            
-        soup = BeautifulSoup(html_content, 'html.parser')
+        
         base_domain = urlparse(base_url).netloc
         
         links = []
@@ -180,9 +317,4 @@ class WebProcessor:
         if not html_content:
             return None
         
-        result = self.process_url(url)
-        
-        if include_links:
-            result["links"] = self.extract_links(html_content, url)
-        
-        return result 
\ No newline at end of file
+        return self.process_html(html_content, url, include_links=include_links) 
\ No newline at end of file